@@ -1,18 +1,24 @@
-from fastapi import FastAPI, APIRouter, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, APIRouter, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.responses import HTMLResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import InsertOne
+from pymongo.errors import BulkWriteError, ConnectionFailure
+import redis.asyncio as aioredis
 import os
 import logging
-import json
+import orjson
+import msgpack
 import asyncio
+import math
+import time
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Optional
-import uuid
+from typing import Dict, List, Optional, Set, Tuple
+import secrets
 from datetime import datetime, timezone
 
 ROOT_DIR = Path(__file__).parent
@@ -20,53 +26,353 @@ load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+# Keep a warm pool sized for concurrent GPS writes instead of the driver defaults
+client = AsyncIOMotorClient(
+    mongo_url,
+    minPoolSize=10,
+    maxPoolSize=50,
+    maxIdleTimeMS=30000,
+    retryWrites=True,
+    w=1,
+    compressors="zstd"
+)
 db = client[os.environ['DB_NAME']]
 
+# Redis connection (latest GPS position cache). Short timeouts let a hung Redis
+# fail fast into the MongoDB fallbacks instead of stalling requests.
+redis_url = os.environ.get('REDIS_URL', 'redis://localhost:6379')
+redis_timeout = float(os.environ.get('REDIS_TIMEOUT', '0.5'))
+redis_client = aioredis.from_url(
+    redis_url,
+    socket_timeout=redis_timeout,
+    socket_connect_timeout=redis_timeout
+)
+# The pub/sub relay blocks on reads between messages, so its connection must
+# not use socket_timeout; health checks detect a dead connection instead
+pubsub_client = aioredis.from_url(
+    redis_url,
+    socket_connect_timeout=redis_timeout,
+    health_check_interval=30
+)
+LAST_POSITION_KEY = "gps:last"
+LAST_FRAME_KEY = "gps:last:frame"
+LAST_POSITION_TTL = 3600
+GPS_CHANNEL = "gps_channel"
+# Clients that haven't subscribed to a room receive every GPS update
+DEFAULT_ROOM = "all"
+VEHICLE_ROOM_PREFIX = "vehicle:"
+ROUTE_CACHE_TTL = 300
+
 # Create the main app
 app = FastAPI(title="Renault Talisman GPS Navigator 3D")
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
+def _msgpack_default(obj):
+    if isinstance(obj, datetime):
+        # Naive datetimes are read back from Mongo and are UTC
+        if obj.tzinfo is None:
+            obj = obj.replace(tzinfo=timezone.utc)
+        return obj.isoformat()
+    raise TypeError(f"Cannot serialize {type(obj).__name__}")
+
+def pack_frame(obj) -> bytes:
+    """Encode a websocket message as a binary msgpack frame"""
+    return msgpack.packb(obj, default=_msgpack_default, use_bin_type=True)
+
 # WebSocket Connection Manager
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+    """Each client gets a bounded outbound queue drained by its own writer task"""
+
+    def __init__(self, queue_size: int = 64, max_rooms: int = 16):
+        self.queue_size = queue_size
+        self.max_rooms = max_rooms
+        self.active_connections: Dict[WebSocket, Tuple[asyncio.Queue, asyncio.Task]] = {}
+        self.rooms: Dict[str, Set[WebSocket]] = {}
+        self.subscriptions: Dict[WebSocket, Set[str]] = {}
+        self.closing: Set[asyncio.Task] = set()
     
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        task = asyncio.create_task(self._writer(websocket, queue))
+        self.active_connections[websocket] = (queue, task)
+        self._join(websocket, DEFAULT_ROOM)
     
     def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
+        connection = self._forget(websocket)
+        if connection:
+            connection[1].cancel()
+    
+    def subscribe(self, websocket: WebSocket, room: str):
+        if websocket not in self.active_connections:
+            return
+        rooms = self.subscriptions.get(websocket, set())
+        if room not in rooms and len(rooms - {DEFAULT_ROOM}) >= self.max_rooms:
+            return
+        self._leave(websocket, DEFAULT_ROOM)
+        self._join(websocket, room)
+    
+    def unsubscribe(self, websocket: WebSocket, room: str):
+        self._leave(websocket, room)
+        if websocket in self.active_connections and not self.subscriptions.get(websocket):
+            self._join(websocket, DEFAULT_ROOM)
     
-    async def broadcast(self, message: str):
-        for connection in self.active_connections[:]:
+    def _join(self, websocket: WebSocket, room: str):
+        self.rooms.setdefault(room, set()).add(websocket)
+        self.subscriptions.setdefault(websocket, set()).add(room)
+    
+    def _leave(self, websocket: WebSocket, room: str):
+        members = self.rooms.get(room)
+        if members is not None:
+            members.discard(websocket)
+            if not members:
+                del self.rooms[room]
+        rooms = self.subscriptions.get(websocket)
+        if rooms is not None:
+            rooms.discard(room)
+    
+    def _forget(self, websocket: WebSocket):
+        for room in self.subscriptions.pop(websocket, set()):
+            self._leave(websocket, room)
+        return self.active_connections.pop(websocket, None)
+    
+    async def _writer(self, websocket: WebSocket, queue: asyncio.Queue):
+        while True:
+            message = await queue.get()
             try:
-                await connection.send_text(message)
-            except:
-                await self.disconnect_safely(connection)
+                await websocket.send_bytes(message)
+            except Exception:
+                self._forget(websocket)
+                await self._close(websocket)
+                return
     
-    async def disconnect_safely(self, websocket: WebSocket):
+    def send_personal_message(self, message: bytes, websocket: WebSocket):
+        connection = self.active_connections.get(websocket)
+        if connection is None:
+            return
+        try:
+            connection[0].put_nowait(message)
+        except asyncio.QueueFull:
+            # The client can't keep up; drop it rather than buffer without limit.
+            # Close in the background: the handshake waits on that same slow client.
+            self.disconnect(websocket)
+            task = asyncio.create_task(self._close(websocket))
+            self.closing.add(task)
+            task.add_done_callback(self.closing.discard)
+    
+    def broadcast_to(self, room: Optional[str], message: bytes):
+        # Only reaches sockets held by this worker; see relay_gps_updates
+        targets = set(self.rooms.get(DEFAULT_ROOM, ()))
+        if room:
+            targets.update(self.rooms.get(room, ()))
+        for websocket in targets:
+            self.send_personal_message(message, websocket)
+    
+    async def _close(self, websocket: WebSocket):
         try:
             await websocket.close()
         except:
             pass
-        self.disconnect(websocket)
 
 manager = ConnectionManager()
 
+# Buffered MongoDB writes
+_FLUSH = object()
+
+# Caps direct (unbatched) MongoDB writes below maxPoolSize so a burst of them
+# can't take every pooled connection away from reads and batch flushes.
+# Batched inserts need no permit: each collection has a single writer task,
+# and its bounded queue is what pushes back on producers.
+db_sem = asyncio.Semaphore(32)
+
+class MongoWriteBatcher:
+    """Collect inserts per collection and write them with a single bulk_write"""
+
+    def __init__(self, database, batch_size: int = 500, max_delay_ms: int = 20,
+                 max_pending: int = 5000, max_retries: int = 3):
+        self.database = database
+        self.batch_size = batch_size
+        self.max_delay = max_delay_ms / 1000
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.queues: Dict[str, asyncio.Queue] = {}
+        self.tasks: Dict[str, asyncio.Task] = {}
+    
+    async def enqueue(self, collection: str, document: dict):
+        queue = self.queues.get(collection)
+        if queue is None:
+            queue = self.queues[collection] = asyncio.Queue(maxsize=self.max_pending)
+            self.tasks[collection] = asyncio.create_task(self._run(collection, queue))
+        # Copy so the _id added by pymongo never leaks back to the caller.
+        # A full queue makes the caller wait, pushing back on the producer.
+        await queue.put(dict(document))
+    
+    async def _run(self, collection: str, queue: asyncio.Queue):
+        loop = asyncio.get_running_loop()
+        closing = False
+        while not closing:
+            document = await queue.get()
+            if document is _FLUSH:
+                break
+            batch = [document]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.batch_size:
+                try:
+                    document = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        document = await asyncio.wait_for(queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if document is _FLUSH:
+                    closing = True
+                    break
+                batch.append(document)
+            await self._write(collection, batch)
+    
+    async def _write(self, collection: str, batch: List[dict]):
+        for attempt in range(self.max_retries + 1):
+            try:
+                await self.database[collection].bulk_write(
+                    [InsertOne(document) for document in batch], ordered=False
+                )
+                return
+            except BulkWriteError as exc:
+                # pymongo set each document's _id on the first attempt, so on a
+                # retry a duplicate key means that document was already stored
+                errors = [
+                    error for error in exc.details.get("writeErrors", [])
+                    if not (attempt and error.get("code") == 11000)
+                ]
+                if errors:
+                    logger.error(
+                        "Bulk write to %s inserted %d of %d documents; errors: %s",
+                        collection, exc.details.get("nInserted", 0), len(batch), errors
+                    )
+                return
+            except ConnectionFailure:
+                if attempt == self.max_retries:
+                    logger.exception(
+                        "Bulk write of %d documents to %s failed after %d attempts",
+                        len(batch), collection, attempt + 1
+                    )
+                    return
+                logger.warning("Bulk write to %s failed, retrying", collection, exc_info=True)
+                await asyncio.sleep(0.5 * (attempt + 1))
+            except Exception:
+                logger.exception("Bulk write of %d documents to %s failed", len(batch), collection)
+                return
+    
+    async def stop(self):
+        """Flush pending documents and stop the writer tasks"""
+        for queue in self.queues.values():
+            await queue.put(_FLUSH)
+        await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+        self.queues.clear()
+        self.tasks.clear()
+
+batcher = MongoWriteBatcher(db)
+
+POSITION_PROJECTION = {
+    "_id": 0, "id": 1, "latitude": 1, "longitude": 1, "altitude": 1,
+    "speed": 1, "heading": 1, "vehicle_id": 1, "timestamp": 1,
+}
+
+def vehicle_room(vehicle_id: str) -> str:
+    return f"{VEHICLE_ROOM_PREFIX}{vehicle_id}"
+
+def latest_position_keys(vehicle_id: Optional[str] = None) -> Tuple[str, str]:
+    """Redis keys holding the latest position and its reply frame"""
+    if vehicle_id:
+        room = vehicle_room(vehicle_id)
+        return f"{LAST_POSITION_KEY}:{room}", f"{LAST_FRAME_KEY}:{room}"
+    return LAST_POSITION_KEY, LAST_FRAME_KEY
+
+async def get_latest_position(vehicle_id: Optional[str] = None) -> Optional[dict]:
+    """Read the latest GPS position (of one vehicle, or of any) from Redis, falling back to MongoDB"""
+    try:
+        cached = await redis_client.get(latest_position_keys(vehicle_id)[0])
+        if cached:
+            return orjson.loads(cached)
+    except aioredis.RedisError:
+        logger.warning("Latest position cache read failed, using MongoDB", exc_info=True)
+    # Older documents carry ISO string timestamps, which sort above numbers
+    query = {"timestamp": {"$type": "number"}}
+    hint = [("timestamp", -1)]
+    if vehicle_id:
+        query["vehicle_id"] = vehicle_id
+        hint = [("vehicle_id", 1), ("timestamp", -1)]
+    position = await db.gps_positions.find_one(
+        query,
+        projection=POSITION_PROJECTION,
+        sort=[("timestamp", -1)],
+        hint=hint
+    )
+    return position
+
+async def get_latest_position_frame(vehicle_id: Optional[str] = None) -> Optional[bytes]:
+    """Packed position_update frame for the latest position, if there is one"""
+    try:
+        frame = await redis_client.get(latest_position_keys(vehicle_id)[1])
+    except aioredis.RedisError:
+        frame = None
+    if frame is None:
+        position = await get_latest_position(vehicle_id)
+        if position:
+            frame = pack_frame({
+                "type": "position_update",
+                "data": position
+            })
+    return frame
+
 # Pydantic Models
+def new_id() -> str:
+    # 128 random bits as hex, without building and formatting a UUID object
+    return secrets.token_hex(16)
+
+# Coarse UTC clock refreshed by tick_clock, so model timestamps don't each cost a syscall.
+# Without the task (no lifespan events, e.g. the app imported into a script)
+# the cached value would freeze, so read the real clock instead.
+CLOCK_RESOLUTION = 0.01
+_now = [datetime.now(timezone.utc)]
+_now_ms = [int(_now[0].timestamp() * 1000)]
+_clock_running = [False]
+
+def utc_now() -> datetime:
+    if _clock_running[0]:
+        return _now[0]
+    return datetime.now(timezone.utc)
+
+def epoch_ms() -> int:
+    if _clock_running[0]:
+        return _now_ms[0]
+    return int(time.time() * 1000)
+
+async def tick_clock():
+    _clock_running[0] = True
+    try:
+        while True:
+            _now[0] = datetime.now(timezone.utc)
+            _now_ms[0] = int(_now[0].timestamp() * 1000)
+            await asyncio.sleep(CLOCK_RESOLUTION)
+    finally:
+        _clock_running[0] = False
+
 class GPSPosition(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=new_id)
     latitude: float
     longitude: float
     altitude: Optional[float] = None
     speed: Optional[float] = None
     heading: Optional[float] = None
-    timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    vehicle_id: Optional[str] = None
+    # Milliseconds since the Unix epoch, stored as a BSON int64
+    timestamp: int = Field(default_factory=epoch_ms)
 
 class RouteRequest(BaseModel):
     start_lat: float
@@ -77,62 +383,110 @@ class RouteRequest(BaseModel):
     avoid_tolls: bool = False
 
 class FavoriteLocation(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=new_id)
     name: str
     address: str
     latitude: float
     longitude: float
     category: str = "general"
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    created_at: datetime = Field(default_factory=utc_now)
 
 class NavigationSession(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=new_id)
     start_location: dict
     destination: dict
     route_data: Optional[dict] = None
-    started_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    started_at: datetime = Field(default_factory=utc_now)
     status: str = "active"
 
+# Duplicate GPS suppression: a position within DUPLICATE_DISTANCE_M and
+# DUPLICATE_WINDOW_MS of the last one stored for the same client is dropped
+DUPLICATE_DISTANCE_M = 2.0
+DUPLICATE_WINDOW_MS = 1000
+MAX_TRACKED_CLIENTS = 10000
+METERS_PER_DEGREE = 111320
+last_positions: Dict[str, Tuple[float, float, int, float]] = {}
+
+def is_duplicate_position(client_key: str, position: GPSPosition) -> bool:
+    last = last_positions.get(client_key)
+    if last is not None:
+        lat, lng, timestamp, lng_scale = last
+        if abs(position.timestamp - timestamp) < DUPLICATE_WINDOW_MS:
+            # Flat-earth approximation is plenty at a few metres
+            dy = (position.latitude - lat) * METERS_PER_DEGREE
+            dx = (position.longitude - lng) * lng_scale
+            if dx * dx + dy * dy < DUPLICATE_DISTANCE_M ** 2:
+                return True
+        del last_positions[client_key]
+    elif len(last_positions) >= MAX_TRACKED_CLIENTS:
+        # Evict the client that has gone longest without a stored position
+        del last_positions[next(iter(last_positions))]
+    lng_scale = METERS_PER_DEGREE * math.cos(math.radians(position.latitude))
+    last_positions[client_key] = (position.latitude, position.longitude, position.timestamp, lng_scale)
+    return False
+
 # API Routes
 @api_router.get("/")
 async def root():
     return {"message": "Renault Talisman GPS 3D Navigator API", "version": "1.0.0"}
 
 @api_router.post("/gps/position", response_model=GPSPosition)
-async def update_gps_position(position: GPSPosition):
+async def update_gps_position(position: GPSPosition, request: Request):
     """Update current GPS position"""
-    position_dict = position.dict()
-    position_dict['timestamp'] = position_dict['timestamp'].isoformat()
+    client_key = (
+        position.vehicle_id
+        or request.headers.get("X-Client-Id")
+        or (request.client.host if request.client else "")
+    )
+    if is_duplicate_position(client_key, position):
+        return Response(status_code=204)
+    
+    position_dict = position.model_dump(mode="json")
     
     # Store in database
-    await db.gps_positions.insert_one(position_dict)
+    await batcher.enqueue("gps_positions", position_dict)
     
-    # Broadcast to connected clients
-    await manager.broadcast(json.dumps({
+    # Cache the position (and the ready-made reply frame for request_position),
+    # globally and per vehicle, then broadcast to the vehicle's room on every
+    # worker, in one round trip
+    channel = GPS_CHANNEL
+    key_pairs = [latest_position_keys()]
+    if position.vehicle_id:
+        channel = f"{GPS_CHANNEL}:{vehicle_room(position.vehicle_id)}"
+        key_pairs.append(latest_position_keys(position.vehicle_id))
+    position_json = position.model_dump_json()
+    position_frame = pack_frame({
+        "type": "position_update",
+        "data": position_dict
+    })
+    pipe = redis_client.pipeline(transaction=False)
+    for position_key, frame_key in key_pairs:
+        pipe.set(position_key, position_json, ex=LAST_POSITION_TTL)
+        pipe.set(frame_key, position_frame, ex=LAST_POSITION_TTL)
+    pipe.publish(channel, pack_frame({
         "type": "gps_update",
         "data": position_dict
     }))
+    try:
+        await pipe.execute()
+    except aioredis.RedisError:
+        # The position is already queued for MongoDB; don't fail the request
+        logger.warning("Caching/publishing GPS position %s failed", position.id, exc_info=True)
     
     return position
 
 @api_router.get("/gps/current")
-async def get_current_position():
-    """Get the most recent GPS position"""
-    position = await db.gps_positions.find_one(
-        {}, 
-        sort=[("timestamp", -1)]
-    )
+async def get_current_position(vehicle_id: Optional[str] = None):
+    """Get the most recent GPS position, optionally for one vehicle"""
+    position = await get_latest_position(vehicle_id)
     if position:
-        position['_id'] = str(position['_id'])
         return position
     return {"message": "No GPS data available"}
 
-@api_router.post("/route/calculate")
-async def calculate_route(route_request: RouteRequest):
-    """Calculate route between two points"""
+def compute_route(route_request: RouteRequest) -> dict:
     # This would integrate with MapBox Directions API
     # For now, return mock data
-    route_data = {
+    return {
         "distance": "42.3 km",
         "duration": "35 minutes",
         "steps": [
@@ -140,14 +494,41 @@ async def calculate_route(route_request: RouteRequest):
             {"instruction": "Tourner à droite sur Boulevard Haussmann", "distance": "2.1 km"},
             {"instruction": "Continuer tout droit sur A1", "distance": "38.7 km"},
             {"instruction": "Sortie 15 vers destination", "distance": "1.0 km"}
-        ],
-        "coordinates": [
-            [route_request.start_lng, route_request.start_lat],
-            [route_request.start_lng + 0.01, route_request.start_lat + 0.01],
-            [route_request.end_lng - 0.01, route_request.end_lat - 0.01],
-            [route_request.end_lng, route_request.end_lat]
         ]
     }
+
+def route_coordinates(route_request: RouteRequest) -> List[List[float]]:
+    return [
+        [route_request.start_lng, route_request.start_lat],
+        [route_request.start_lng + 0.01, route_request.start_lat + 0.01],
+        [route_request.end_lng - 0.01, route_request.end_lat - 0.01],
+        [route_request.end_lng, route_request.end_lat]
+    ]
+
+@api_router.post("/route/calculate")
+async def calculate_route(route_request: RouteRequest):
+    """Calculate route between two points"""
+    # Distance, duration and steps are shared by requests within ~10 m of each
+    # other; the coordinates are always rebuilt from this caller's own points
+    cache_key = "route:{}:{}:{}:{}:{}:{}".format(
+        round(route_request.start_lat, 4), round(route_request.start_lng, 4),
+        round(route_request.end_lat, 4), round(route_request.end_lng, 4),
+        route_request.vehicle_type, route_request.avoid_tolls
+    )
+    route_data = None
+    try:
+        cached = await redis_client.get(cache_key)
+        if cached:
+            route_data = orjson.loads(cached)
+    except aioredis.RedisError:
+        logger.warning("Route cache read failed", exc_info=True)
+    if route_data is None:
+        route_data = compute_route(route_request)
+        try:
+            await redis_client.set(cache_key, orjson.dumps(route_data), ex=ROUTE_CACHE_TTL)
+        except aioredis.RedisError:
+            logger.warning("Route cache write failed", exc_info=True)
+    route_data["coordinates"] = route_coordinates(route_request)
     
     # Store navigation session
     session = NavigationSession(
@@ -156,35 +537,32 @@ async def calculate_route(route_request: RouteRequest):
         route_data=route_data
     )
     
-    session_dict = session.dict()
-    session_dict['started_at'] = session_dict['started_at'].isoformat()
-    await db.navigation_sessions.insert_one(session_dict)
+    session_dict = session.model_dump(mode="json")
+    await batcher.enqueue("navigation_sessions", session_dict)
     
     return {"route": route_data, "session_id": session.id}
 
 @api_router.post("/favorites", response_model=FavoriteLocation)
 async def add_favorite_location(location: FavoriteLocation):
     """Add a favorite location"""
-    location_dict = location.dict()
-    location_dict['created_at'] = location_dict['created_at'].isoformat()
+    location_dict = location.model_dump(mode="json")
     
-    await db.favorite_locations.insert_one(location_dict)
+    async with db_sem:
+        await db.favorite_locations.insert_one(location_dict)
     return location
 
-@api_router.get("/favorites", response_model=List[FavoriteLocation])
+@api_router.get("/favorites")
 async def get_favorite_locations():
     """Get all favorite locations"""
-    favorites = await db.favorite_locations.find().to_list(1000)
-    result = []
-    for fav in favorites:
-        fav['_id'] = str(fav['_id'])
-        result.append(FavoriteLocation(**fav))
-    return result
+    # Documents were validated on insert, so return them as stored
+    cursor = db.favorite_locations.find({}, projection={"_id": 0})
+    return await cursor.to_list(1000)
 
 @api_router.delete("/favorites/{location_id}")
 async def delete_favorite_location(location_id: str):
     """Delete a favorite location"""
-    result = await db.favorite_locations.delete_one({"id": location_id})
+    async with db_sem:
+        result = await db.favorite_locations.delete_one({"id": location_id})
     if result.deleted_count:
         return {"message": "Location supprimée avec succès"}
     return {"message": "Location non trouvée"}
@@ -192,9 +570,8 @@ async def delete_favorite_location(location_id: str):
 @api_router.get("/navigation/history")
 async def get_navigation_history():
     """Get navigation history"""
-    history = await db.navigation_sessions.find({}, sort=[("started_at", -1)]).to_list(50)
-    for session in history:
-        session['_id'] = str(session['_id'])
+    cursor = db.navigation_sessions.find({}, projection={"_id": 0}, sort=[("started_at", -1)])
+    history = await cursor.to_list(50)
     return {"history": history}
 
 # WebSocket endpoint for real-time updates
@@ -204,23 +581,47 @@ async def websocket_endpoint(websocket: WebSocket):
     try:
         while True:
             # Keep connection alive and handle incoming messages
-            data = await websocket.receive_text()
-            message = json.loads(data)
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                break
+            if frame.get("bytes") is not None:
+                message = msgpack.unpackb(frame["bytes"])
+            else:
+                message = orjson.loads(frame["text"])
             
-            # Handle different message types
-            if message.get("type") == "ping":
-                await websocket.send_text(json.dumps({"type": "pong"}))
+            if not isinstance(message, dict):
+                continue
+            
+            # Handle different message types (keepalive uses protocol-level pings)
+            room = message.get("room")
+            if message.get("type") == "subscribe" and isinstance(room, str) and room:
+                manager.subscribe(websocket, room)
+            elif message.get("type") == "unsubscribe" and isinstance(room, str) and room:
+                manager.unsubscribe(websocket, room)
             elif message.get("type") == "request_position":
-                # Send current position to this specific client
-                current_pos = await db.gps_positions.find_one({}, sort=[("timestamp", -1)])
-                if current_pos:
-                    current_pos['_id'] = str(current_pos['_id'])
-                    await websocket.send_text(json.dumps({
-                        "type": "position_update",
-                        "data": current_pos
-                    }))
+                # Send the current position of the requested vehicle, or of each
+                # vehicle room this client is in; clients in the default room get
+                # the latest position of any vehicle
+                vehicle_id = message.get("vehicle_id")
+                if isinstance(vehicle_id, str) and vehicle_id:
+                    vehicle_ids = [vehicle_id]
+                else:
+                    rooms = manager.subscriptions.get(websocket, set())
+                    if DEFAULT_ROOM in rooms:
+                        vehicle_ids = [None]
+                    else:
+                        vehicle_ids = [
+                            room[len(VEHICLE_ROOM_PREFIX):] for room in rooms
+                            if room.startswith(VEHICLE_ROOM_PREFIX)
+                        ]
+                for vehicle_id in vehicle_ids:
+                    reply = await get_latest_position_frame(vehicle_id)
+                    if reply:
+                        manager.send_personal_message(reply, websocket)
                     
     except WebSocketDisconnect:
+        pass
+    finally:
         manager.disconnect(websocket)
 
 # Include the router in the main app
@@ -241,6 +642,60 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def create_indexes():
+    await db.gps_positions.create_index([("timestamp", -1)])
+    await db.gps_positions.create_index([("vehicle_id", 1), ("timestamp", -1)])
+    await db.navigation_sessions.create_index([("started_at", -1)])
+
+RELAY_MAX_BACKOFF = 5
+
+async def relay_gps_updates():
+    """Forward GPS updates published by any worker to this worker's sockets"""
+    backoff = 0
+    while True:
+        pubsub = pubsub_client.pubsub()
+        try:
+            # Room-specific updates are published on "<GPS_CHANNEL>:<room>"
+            await pubsub.psubscribe(f"{GPS_CHANNEL}*")
+            if backoff:
+                logger.info("GPS relay resubscribed")
+                backoff = 0
+            async for message in pubsub.listen():
+                if message["type"] == "pmessage":
+                    room = message["channel"].decode()[len(GPS_CHANNEL) + 1:]
+                    manager.broadcast_to(room or None, message["data"])
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Never let the relay die silently; this worker's sockets depend on it.
+            # Only the first failure of an outage gets a traceback.
+            if not backoff:
+                logger.exception("GPS relay failed, resubscribing")
+                backoff = 0.5
+            else:
+                backoff = min(backoff * 2, RELAY_MAX_BACKOFF)
+            await asyncio.sleep(backoff)
+        finally:
+            try:
+                await pubsub.aclose()
+            except Exception:
+                pass
+
+@app.on_event("startup")
+async def start_gps_relay():
+    app.state.gps_relay = asyncio.create_task(relay_gps_updates())
+
+@app.on_event("startup")
+async def start_clock():
+    app.state.clock = asyncio.create_task(tick_clock())
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    app.state.gps_relay.cancel()
+    app.state.clock.cancel()
+    await asyncio.gather(app.state.gps_relay, app.state.clock, return_exceptions=True)
+    await batcher.stop()
+    await redis_client.aclose()
+    await pubsub_client.aclose()
     client.close()
\ No newline at end of file
@@ -5,6 +5,7 @@ import { Button } from './components/ui/button';
 import { Input } from './components/ui/input';
 import { Badge } from './components/ui/badge';
 import { Navigation, MapPin, Star, Settings, Route, Compass, Car, Mountain, Zap } from 'lucide-react';
+import { decode } from '@msgpack/msgpack';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
@@ -129,9 +130,11 @@ function App() {
   useEffect(() => {
     const wsUrl = `${BACKEND_URL}/api/ws`.replace('https:', 'wss:').replace('http:', 'ws:');
     const ws = new WebSocket(wsUrl);
+    ws.binaryType = 'arraybuffer';
     
     ws.onmessage = (event) => {
-      const data = JSON.parse(event.data);
+      // Server sends msgpack-encoded binary frames
+      const data = decode(new Uint8Array(event.data));
       if (data.type === 'gps_update') {
         setCurrentPosition(data.data);
       }
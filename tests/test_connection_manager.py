@@ -0,0 +1,99 @@
+import asyncio
+
+import server
+
+
+class FakeWebSocket:
+    def __init__(self, blocked=False):
+        self.sent = []
+        self.closed = False
+        self.unblock = asyncio.Event()
+        if not blocked:
+            self.unblock.set()
+
+    async def accept(self):
+        pass
+
+    async def send_bytes(self, message):
+        await self.unblock.wait()
+        self.sent.append(message)
+
+    async def close(self):
+        self.closed = True
+
+
+async def settle():
+    # Let the writer tasks drain their queues
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_default_room_gets_every_update_and_rooms_get_their_own():
+    async def run():
+        manager = server.ConnectionManager()
+        everyone, car_42, car_99 = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+        for websocket in (everyone, car_42, car_99):
+            await manager.connect(websocket)
+        manager.subscribe(car_42, "vehicle:42")
+        manager.subscribe(car_99, "vehicle:99")
+
+        manager.broadcast_to("vehicle:42", b"42")
+        manager.broadcast_to(None, b"any")
+        await settle()
+
+        assert everyone.sent == [b"42", b"any"]
+        assert car_42.sent == [b"42"]
+        assert car_99.sent == []
+        for websocket in (everyone, car_42, car_99):
+            manager.disconnect(websocket)
+
+    asyncio.run(run())
+
+
+def test_unsubscribing_from_the_last_room_rejoins_the_default_room():
+    async def run():
+        manager = server.ConnectionManager()
+        websocket = FakeWebSocket()
+        await manager.connect(websocket)
+        manager.subscribe(websocket, "vehicle:42")
+        manager.unsubscribe(websocket, "vehicle:42")
+
+        assert manager.subscriptions[websocket] == {server.DEFAULT_ROOM}
+        assert "vehicle:42" not in manager.rooms
+        manager.disconnect(websocket)
+        assert manager.rooms == {} and manager.subscriptions == {}
+
+    asyncio.run(run())
+
+
+def test_rooms_per_socket_are_capped():
+    async def run():
+        manager = server.ConnectionManager(max_rooms=2)
+        websocket = FakeWebSocket()
+        await manager.connect(websocket)
+        for room in ("a", "b", "c"):
+            manager.subscribe(websocket, room)
+
+        assert manager.subscriptions[websocket] == {"a", "b"}
+        manager.disconnect(websocket)
+
+    asyncio.run(run())
+
+
+def test_socket_is_dropped_when_its_queue_overflows():
+    async def run():
+        manager = server.ConnectionManager(queue_size=1)
+        slow, fast = FakeWebSocket(blocked=True), FakeWebSocket()
+        await manager.connect(slow)
+        await manager.connect(fast)
+
+        for message in (b"1", b"2", b"3"):
+            manager.broadcast_to(None, message)
+            await settle()
+
+        assert slow not in manager.active_connections
+        assert slow.closed
+        assert fast.sent == [b"1", b"2", b"3"]
+        manager.disconnect(fast)
+
+    asyncio.run(run())
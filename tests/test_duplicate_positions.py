@@ -0,0 +1,69 @@
+import pytest
+
+import server
+
+# Roughly one metre of latitude
+METRE = 1 / server.METERS_PER_DEGREE
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(server, "last_positions", {})
+
+
+def position(timestamp, latitude=48.8566, longitude=2.3522):
+    return server.GPSPosition(latitude=latitude, longitude=longitude, timestamp=timestamp)
+
+
+def test_first_position_is_not_a_duplicate():
+    assert not server.is_duplicate_position("car", position(1000))
+
+
+def test_same_spot_just_inside_the_window_is_a_duplicate():
+    server.is_duplicate_position("car", position(1000))
+    assert server.is_duplicate_position("car", position(1999))
+
+
+def test_same_spot_at_the_window_edge_is_not_a_duplicate():
+    server.is_duplicate_position("car", position(1000))
+    assert not server.is_duplicate_position("car", position(2000))
+
+
+def test_earlier_timestamp_outside_the_window_is_not_a_duplicate():
+    server.is_duplicate_position("car", position(1500))
+    assert not server.is_duplicate_position("car", position(100))
+
+
+def test_earlier_timestamp_inside_the_window_is_a_duplicate():
+    server.is_duplicate_position("car", position(1500))
+    assert server.is_duplicate_position("car", position(600))
+
+
+def test_distance_threshold():
+    server.is_duplicate_position("car", position(1000))
+    assert server.is_duplicate_position("car", position(1100, latitude=48.8566 + METRE))
+    assert not server.is_duplicate_position("car", position(1200, latitude=48.8566 + 3 * METRE))
+
+
+def test_duplicates_compare_against_the_last_stored_position():
+    server.is_duplicate_position("car", position(1000))
+    assert server.is_duplicate_position("car", position(1500))
+    # 1500 was dropped, so the window still runs from 1000
+    assert not server.is_duplicate_position("car", position(2100))
+
+
+def test_clients_are_tracked_separately():
+    server.is_duplicate_position("car", position(1000))
+    assert not server.is_duplicate_position("van", position(1000))
+
+
+def test_least_recently_stored_client_is_evicted(monkeypatch):
+    monkeypatch.setattr(server, "MAX_TRACKED_CLIENTS", 2)
+    server.is_duplicate_position("a", position(1000))
+    server.is_duplicate_position("b", position(1000))
+    # Storing a new position for "a" makes "b" the oldest entry
+    server.is_duplicate_position("a", position(5000))
+    server.is_duplicate_position("c", position(1000))
+
+    assert list(server.last_positions) == ["a", "c"]
+    assert not server.is_duplicate_position("b", position(1100))
@@ -0,0 +1,106 @@
+import asyncio
+import logging
+
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+import server
+
+
+class FakeCollection:
+    def __init__(self, failures=()):
+        self.failures = list(failures)
+        self.batches = []
+        self.calls = 0
+
+    async def bulk_write(self, requests, ordered):
+        self.calls += 1
+        assert ordered is False
+        if self.failures:
+            raise self.failures.pop(0)
+        self.batches.append([request._doc for request in requests])
+
+
+class FakeDatabase(dict):
+    def __missing__(self, name):
+        collection = self[name] = FakeCollection()
+        return collection
+
+
+def test_batches_are_split_at_batch_size():
+    database = FakeDatabase()
+    batcher = server.MongoWriteBatcher(database, batch_size=3, max_delay_ms=1000)
+
+    async def run():
+        for i in range(7):
+            await batcher.enqueue("gps_positions", {"i": i})
+        await batcher.stop()
+
+    asyncio.run(run())
+    batches = database["gps_positions"].batches
+    assert [len(batch) for batch in batches] == [3, 3, 1]
+    assert [doc["i"] for batch in batches for doc in batch] == list(range(7))
+
+
+def test_stop_flushes_pending_documents():
+    database = FakeDatabase()
+    batcher = server.MongoWriteBatcher(database, max_delay_ms=60000)
+    position = {"id": "a", "latitude": 1.0}
+
+    async def run():
+        await batcher.enqueue("gps_positions", position)
+        await batcher.enqueue("navigation_sessions", {"id": "b"})
+        await batcher.stop()
+
+    asyncio.run(run())
+    assert database["gps_positions"].batches == [[position]]
+    assert database["navigation_sessions"].batches == [[{"id": "b"}]]
+    # The caller's dict is not the one pymongo stamps with an _id
+    assert database["gps_positions"].batches[0][0] is not position
+    assert batcher.tasks == {}
+
+
+def test_write_retries_after_auto_reconnect():
+    collection = FakeCollection(failures=[AutoReconnect("primary stepped down")])
+    batcher = server.MongoWriteBatcher({"gps_positions": collection})
+
+    asyncio.run(batcher._write("gps_positions", [{"i": 0}, {"i": 1}]))
+    assert collection.calls == 2
+    assert collection.batches == [[{"i": 0}, {"i": 1}]]
+
+
+def test_write_gives_up_after_max_retries(caplog):
+    collection = FakeCollection(failures=[AutoReconnect("down")])
+    batcher = server.MongoWriteBatcher({"gps_positions": collection}, max_retries=0)
+
+    with caplog.at_level(logging.ERROR):
+        asyncio.run(batcher._write("gps_positions", [{"i": 0}]))
+    assert collection.calls == 1
+    assert "failed after 1 attempts" in caplog.text
+
+
+def test_duplicate_keys_after_retry_are_not_reported(caplog):
+    duplicate = BulkWriteError({
+        "nInserted": 1,
+        "writeErrors": [{"index": 0, "code": 11000, "errmsg": "duplicate key"}],
+    })
+    collection = FakeCollection(failures=[AutoReconnect("down"), duplicate])
+    batcher = server.MongoWriteBatcher({"gps_positions": collection})
+
+    with caplog.at_level(logging.ERROR):
+        asyncio.run(batcher._write("gps_positions", [{"i": 0}, {"i": 1}]))
+    assert collection.calls == 2
+    assert not [record for record in caplog.records if record.levelno >= logging.ERROR]
+
+
+def test_partial_bulk_write_failure_is_reported(caplog):
+    failure = BulkWriteError({
+        "nInserted": 1,
+        "writeErrors": [{"index": 1, "code": 121, "errmsg": "validation failed"}],
+    })
+    collection = FakeCollection(failures=[failure])
+    batcher = server.MongoWriteBatcher({"gps_positions": collection})
+
+    with caplog.at_level(logging.ERROR):
+        asyncio.run(batcher._write("gps_positions", [{"i": 0}, {"i": 1}]))
+    assert collection.calls == 1
+    assert "inserted 1 of 2 documents" in caplog.text